@@ -1,57 +1,231 @@
 import re
 import os
-from flask import Flask, request, jsonify, session
+import sys
+from flask import Flask, Response, request, jsonify, session
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_session.redis import RedisSessionInterface
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
+import pyjson5
+import ijson
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from urllib.parse import urlparse
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import Aborted, Conflict, DeadlineExceeded, ServiceUnavailable
+from cachetools import TTLCache
+import redis
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import Annotated, Optional
 import uuid
+import hashlib
+import threading
+import queue
+import atexit
+import time
+import itertools
 
 # Setup logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# gunicorn's gevent workers monkey-patch the stdlib before importing the app; grpc (used by
+# Firestore) has to be told separately before any client is created
+if 'gevent' in sys.modules:
+    from gevent import monkey
+    if monkey.is_module_patched('socket'):
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+
 # Initialize Firebase with in-memory JSON
+firebase_app = None
 firebase_json_str = os.environ.get("FIREBASE_CREDENTIALS")
 if firebase_json_str and not firebase_admin._apps:
     try:
-        cred_dict = json.loads(firebase_json_str)
+        cred_dict = orjson.loads(firebase_json_str)
         cred = credentials.Certificate(cred_dict)
-        firebase_admin.initialize_app(cred)
-        db = firestore.client()
-        logger.info("✅ Firebase initialized and Firestore client created")
+        firebase_app = firebase_admin.initialize_app(cred)
+        logger.info("✅ Firebase initialized")
     except Exception as e:
-        logger.error(f"🔥 Firebase initialization failed: {str(e)}")
-        db = None
+        logger.error("🔥 Firebase initialization failed: %s", e)
+
+# Firestore clients are created on first use, i.e. inside the gunicorn worker after fork, since
+# gRPC channels don't survive a fork. Several clients spread writes over separate channels.
+FIRESTORE_POOL_SIZE = int(os.environ.get('FIRESTORE_POOL_SIZE', 4))
+_db_cycle = None
+_db_pool_lock = threading.Lock()
+_firestore_local = threading.local()
+
+def get_db():
+    global _db_cycle
+    if firebase_app is None:
+        return None
+    if _db_cycle is None:
+        with _db_pool_lock:
+            if _db_cycle is None:
+                project = firebase_app.project_id
+                if not project:
+                    raise ValueError("Project ID is required to access Firestore")
+                credential = firebase_app.credential.get_credential()
+                clients = [firestore.Client(credentials=credential, project=project) for _ in range(FIRESTORE_POOL_SIZE)]
+                _db_cycle = itertools.cycle(clients)
+                logger.info("✅ Created %d Firestore client(s)", len(clients))
+    return next(_db_cycle)
+
+def _writer_db():
+    # Each writer thread keeps the client it was handed, so batches don't share a channel
+    db = getattr(_firestore_local, 'db', None)
+    if db is None:
+        db = _firestore_local.db = get_db()
+    return db
+
+# Submissions are queued and committed to Firestore in batches, off the request path
+FIRESTORE_COLLECTION = "audit_submissions"
+FIRESTORE_BATCH_SIZE = 100
+FIRESTORE_FLUSH_INTERVAL = 0.5
+FIRESTORE_COMMIT_ATTEMPTS = 3
+FIRESTORE_RETRYABLE_ERRORS = (Aborted, Conflict, DeadlineExceeded, ServiceUnavailable)
+_submission_queue = queue.Queue()
+_firestore_pool = ThreadPoolExecutor(max_workers=FIRESTORE_POOL_SIZE, thread_name_prefix="firestore-writer")
+_batcher_thread = None
+_batcher_lock = threading.Lock()
+
+def _commit_submissions(docs):
+    try:
+        # Document ids are fixed up front so a retried commit overwrites rather than duplicates
+        db = _writer_db()
+        collection = db.collection(FIRESTORE_COLLECTION)
+        writes = [(collection.document(), doc) for doc in docs]
+        for attempt in range(1, FIRESTORE_COMMIT_ATTEMPTS + 1):
+            batch = db.batch()
+            for ref, doc in writes:
+                batch.set(ref, doc)
+            try:
+                batch.commit()
+                break
+            except FIRESTORE_RETRYABLE_ERRORS as e:
+                if attempt == FIRESTORE_COMMIT_ATTEMPTS:
+                    raise
+                logger.warning("Firestore batch commit failed (attempt %d), retrying: %s", attempt, e)
+                time.sleep(0.2 * 2 ** (attempt - 1))
+        logger.info("Stored %d submission(s) in Firebase", len(docs))
+    except Exception as e:
+        logger.error("Failed to store %d submission(s) in Firebase: %s", len(docs), e)
+
+def _batch_submissions():
+    while True:
+        doc = _submission_queue.get()
+        if doc is None:
+            return
+        docs = [doc]
+        deadline = time.monotonic() + FIRESTORE_FLUSH_INTERVAL
+        stop = False
+        while len(docs) < FIRESTORE_BATCH_SIZE:
+            try:
+                doc = _submission_queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if doc is None:
+                stop = True
+                break
+            docs.append(doc)
+        try:
+            _firestore_pool.submit(_commit_submissions, docs)
+        except RuntimeError:
+            # The pool is already shut down during interpreter exit; commit on this thread
+            _commit_submissions(docs)
+        if stop:
+            return
+
+def _enqueue_submission(doc):
+    global _batcher_thread
+    if firebase_app is None:
+        logger.error("Failed to store data in Firebase: Firebase not initialized")
+        return
+    # Started lazily so the thread lives in the gunicorn worker, not the master
+    with _batcher_lock:
+        if _batcher_thread is None:
+            _batcher_thread = threading.Thread(target=_batch_submissions, name="firestore-batcher", daemon=True)
+            _batcher_thread.start()
+    _submission_queue.put(doc)
+
+@atexit.register
+def _flush_submissions():
+    if _batcher_thread is None:
+        return
+    _submission_queue.put(None)
+    _batcher_thread.join(timeout=10)
+    # Anything queued behind the stop marker
+    docs = []
+    while True:
+        try:
+            doc = _submission_queue.get_nowait()
+        except queue.Empty:
+            break
+        if doc is not None:
+            docs.append(doc)
+    if docs:
+        _commit_submissions(docs)
+    _firestore_pool.shutdown(wait=True)
+
+DEBUG = os.environ.get('DEBUG', 'False') == 'True'
+
+# jsonify() and the session cookie serializer both encode through app.json. Dates and
+# dataclasses are passed through to Flask's default() (dates become HTTP dates, as with the
+# stdlib provider) and non-string keys are stringified the way json.dumps does.
+_ORJSON_PROVIDER_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+)
 
-app = Flask(__name__)
+class ORJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        option = _ORJSON_PROVIDER_OPTIONS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
 
-app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app = Flask(__name__)
+app.json = ORJSONProvider(app)
+
+# Every worker must sign sessions with the same key, so a per-process random key is dev-only
+secret_key = os.environ.get('SECRET_KEY')
+if not secret_key:
+    if not DEBUG:
+        raise RuntimeError("SECRET_KEY must be set")
+    logger.warning("SECRET_KEY not set; using a random key, sessions will not survive restarts")
+    secret_key = os.urandom(24)
+app.secret_key = secret_key
 app.config.update(
     SESSION_COOKIE_NAME='createlo_session',
     SESSION_COOKIE_SECURE=True,
     SESSION_COOKIE_HTTPONLY=True,
     SESSION_COOKIE_SAMESITE='Lax',
     PERMANENT_SESSION_LIFETIME=timedelta(hours=1),
-    SESSION_REFRESH_EACH_REQUEST=True
+    # Only affects permanent sessions: the Redis-backed sessions below (SESSION_PERMANENT
+    # defaults to True there) would otherwise be re-saved and re-cookied on every request
+    SESSION_REFRESH_EACH_REQUEST=False
 )
 
-allowed_origins = [
+# Origin headers never carry a path, so only scheme://host[:port] entries can match
+_ALLOWED_ORIGINS = frozenset([
     "https://audit.createlo.in",
-    "http://localhost:3000",
-    "http://localhost:3000/audit-form",
-    "http://localhost:3000/business-summary"
-]
+    "http://localhost:3000"
+])
 
 CORS(app,
      supports_credentials=True,
      resources={
          r"/*": {
-             "origins": allowed_origins,
+             "origins": _ALLOWED_ORIGINS,
              "methods": ["GET", "POST", "OPTIONS"],
              "allow_headers": ["Content-Type", "Authorization"],
              "expose_headers": ["Content-Type"],
@@ -60,6 +234,84 @@ CORS(app,
      })
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_MODEL = "models/gemini-1.5-pro-latest"
+GEMINI_GENERATE_URL = f"{GEMINI_API_BASE}/{GEMINI_MODEL}:generateContent"
+# Skip the regex/JS-object recovery path and only accept JSON responses
+GEMINI_STRICT_JSON = os.environ.get('GEMINI_STRICT_JSON', 'False') == 'True'
+
+# Shared session so Gemini calls reuse pooled keep-alive TLS connections. Under gevent each
+# worker can have many calls in flight; connections beyond the pool size are closed after use.
+GEMINI_POOL_SIZE = int(os.environ.get('GEMINI_POOL_SIZE', 100))
+gemini_session = requests.Session()
+gemini_session.headers.update({'Content-Type': 'application/json'})
+# The API key travels as a header so request URLs stay constant and never show up in logs
+if GEMINI_API_KEY:
+    gemini_session.headers['x-goog-api-key'] = GEMINI_API_KEY
+GEMINI_CONNECT_TIMEOUT = 5
+GEMINI_CONNECT_RETRIES = 1
+GEMINI_READ_TIMEOUT = 30
+# Only connection failures are retried here: the request never reached Gemini
+gemini_session.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=GEMINI_POOL_SIZE,
+    max_retries=Retry(total=GEMINI_CONNECT_RETRIES, backoff_factor=0.2)
+))
+# Time the adapter may spend (re)connecting inside one post(), kept out of the read budget
+GEMINI_CONNECT_ALLOWANCE = GEMINI_CONNECT_TIMEOUT * (GEMINI_CONNECT_RETRIES + 1)
+# Rate limits and transient 5xx responses are retried by _post_gemini (generation has no side
+# effects, so resending is safe). The deadline covers a whole call, retries included; it is
+# checked between body chunks, so a single stalled socket read can overrun it by up to its
+# own read timeout.
+GEMINI_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+GEMINI_MAX_ATTEMPTS = 3
+GEMINI_DEADLINE = 40
+GEMINI_RETRY_DELAY_MAX = 3
+# Don't start another attempt that would get less than this long to respond
+GEMINI_MIN_READ_TIMEOUT = 5
+
+# Circuit breaker: after this many consecutive failed calls, fail fast for a while instead of
+# tying up requests on a Gemini outage. Once the window passes, the next failure reopens it.
+GEMINI_BREAKER_THRESHOLD = 10
+GEMINI_BREAKER_RESET_SECONDS = 30
+_gemini_failures = 0
+_gemini_open_until = 0.0
+_gemini_breaker_lock = threading.Lock()
+
+# Recently generated reports, keyed by a hash of the per-request prompt. With REDIS_URL set
+# the cache is shared by all workers and instances; otherwise each process keeps its own.
+REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 3600))
+REDIS_URL = os.environ.get('REDIS_URL')
+redis_client = redis.Redis.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1) if REDIS_URL else None
+_report_cache = TTLCache(maxsize=2048, ttl=REPORT_CACHE_TTL)
+_report_cache_lock = threading.Lock()
+
+# With Redis available the session (and the report stored in it) lives server-side, so the
+# cookie only carries a session id instead of the whole signed report
+class FallbackRedisSessionInterface(RedisSessionInterface):
+    # A Redis outage must not fail requests: sessions are then started empty and not saved,
+    # the same way the report cache falls back when Redis is unreachable
+    def _retrieve_session_data(self, store_id):
+        try:
+            return super()._retrieve_session_data(store_id)
+        except redis.RedisError as e:
+            logger.warning("Session lookup failed, starting an empty session: %s", e)
+            return None
+
+    def _upsert_session(self, session_lifetime, session, store_id):
+        try:
+            super()._upsert_session(session_lifetime, session, store_id)
+        except redis.RedisError as e:
+            logger.warning("Session store failed, session not saved: %s", e)
+
+    def _delete_session(self, store_id):
+        try:
+            super()._delete_session(store_id)
+        except redis.RedisError as e:
+            logger.warning("Session delete failed: %s", e)
+
+if redis_client is not None:
+    app.session_interface = FallbackRedisSessionInterface(app, client=redis_client, key_prefix='createlo:sess:')
 
 @app.route('/')
 def home():
@@ -74,69 +326,73 @@ def submit():
         if not request.is_json:
             return jsonify({"error": "Request must be JSON"}), 400
             
-        data = request.get_json()
-        logger.info(f"Received request with data: {json.dumps(data, indent=2)}")
-        
-        if not data:
-            return jsonify({"error": "No data received"}), 400
-
-        # Validate required fields (website is not required)
-        required_fields = ['email', 'contactNumber']
-        missing_fields = [field for field in required_fields if not data.get(field)]
-        if missing_fields:
-            return jsonify({
-                "error": "Missing required fields",
-                "missing": missing_fields
-            }), 400
+        logger.info("Received /submit payload of %d bytes", request.content_length or 0)
+        # Parsed and validated in one pass; email and contactNumber are required (website is not)
+        try:
+            submission = SubmitData.model_validate_json(request.get_data())
+        except ValidationError as e:
+            return _submit_error_response(e)
+        data = submission.model_dump(exclude_unset=True)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Request data: %s", orjson.dumps(data, option=orjson.OPT_INDENT_2).decode())
+
+        email = submission.email
+        contact_number = submission.contactNumber
+        business_name = submission.businessName or ''
+        business_url = submission.website or ''
+        instagram_url = submission.instagram or ''
+        facebook_url = submission.facebook or ''
+        business_description = submission.businessDescription or ''
 
-        business_url = data.get('website', '')
         if business_url and not is_valid_url(business_url):
             return jsonify({"error": "Invalid business URL"}), 400
 
         # Build the prompt with all available data
         prompt = build_createlo_prompt(
-            data.get('businessName', ''),
+            business_name,
             business_url,
-            data.get('instagram', ''),
-            data.get('facebook', ''),
-            data.get('email', ''),
-            data.get('contactNumber', ''),
-            data.get('businessDescription', '')
+            instagram_url,
+            facebook_url,
+            email,
+            contact_number,
+            business_description
         )
         
-        if not GEMINI_API_KEY:
-            logger.error("Gemini API key not configured")
-            return jsonify({"error": "API service unavailable"}), 503
+        # Identical submissions (retries, double clicks) reuse the report generated earlier
+        report_data = get_cached_report(prompt)
+        if report_data:
+            logger.info("Serving audit report from cache")
+        else:
+            if not GEMINI_API_KEY:
+                logger.error("Gemini API key not configured")
+                return jsonify({"error": "API service unavailable"}), 503
             
-        logger.info("Sending request to Gemini API")
-        gemini_response = send_to_gemini(prompt)
+            logger.info("Sending request to Gemini API")
+            gemini_response = send_to_gemini(prompt)
         
-        if isinstance(gemini_response, str) and gemini_response.startswith("Error"):
-            logger.error(f"Gemini API error: {gemini_response}")
-            return jsonify({"error": gemini_response}), 502
-
-        report_data = extract_report_data(gemini_response)
-        if not report_data:
-            logger.error("Failed to extract report data from Gemini response")
-            return jsonify({
-                "error": "Could not generate audit report",
-                "details": "Failed to process API response"
-            }), 500
+            if isinstance(gemini_response, str) and gemini_response.startswith(("API Error", "Processing Error")):
+                logger.error("Gemini API error: %s", gemini_response)
+                return jsonify({"error": gemini_response}), 502
+
+            report_data = extract_report_data(gemini_response)
+            if not report_data:
+                logger.error("Failed to extract report data from Gemini response")
+                return jsonify({
+                    "error": "Could not generate audit report",
+                    "details": "Failed to process API response"
+                }), 500
+
+            cache_report(prompt, report_data)
 
         # Store report data in session
         session['report_data'] = report_data
         logger.info("Successfully generated audit report")
 
-        # Store user input + AI response in Firebase
-        try:
-            combined_data = {
-                "inputData": data,
-                "reportData": report_data
-            }
-            db.collection("audit_submissions").add(combined_data)
-            logger.info("Data successfully stored in Firebase")
-        except Exception as firebase_error:
-            logger.error(f"Failed to store data in Firebase: {str(firebase_error)}")
+        # Store user input + AI response in Firebase (committed in the background)
+        _enqueue_submission({
+            "inputData": data,
+            "reportData": report_data
+        })
 
         return _corsify_actual_response(jsonify({
             "status": "success",
@@ -144,43 +400,21 @@ def submit():
         }))
 
     except Exception as e:
-        logger.error(f"Error in submit endpoint: {str(e)}", exc_info=True)
+        logger.exception("Error in submit endpoint: %s", e)
         return jsonify({
             "error": "Internal server error",
             "details": str(e)
         }), 500
 
+# http(s) scheme, a host that doesn't start with a separator, and no whitespace anywhere
+_URL_PATTERN = re.compile(r'https?://[^\s/$.?#]\S*', re.IGNORECASE)
+
 def is_valid_url(url):
-    if not url:
-        return True  # Empty URL is valid since website is optional
-    try:
-        result = urlparse(url)
-        return all([result.scheme, result.netloc])
-    except Exception as e:
-        logger.error(f"Invalid URL {url}: {str(e)}")
-        return False
+    # Empty URL is valid since website is optional
+    return not url or _URL_PATTERN.fullmatch(url) is not None
 
-def build_createlo_prompt(business_name, website, instagram, facebook, email, phone, business_description):
-    additional_info = []
-    if business_name:
-        additional_info.append(f"Business Name: {business_name}")
-    if business_description:
-        additional_info.append(f"Business Description: {business_description}")
-    if email:
-        additional_info.append(f"Email: {email}")
-    if phone:
-        additional_info.append(f"Phone: {phone}")
-    if website:
-        additional_info.append(f"Website URL: {website}")
-    if instagram:
-        additional_info.append(f"Instagram URL: {instagram}")
-    if facebook:
-        additional_info.append(f"Facebook URL: {facebook}")
-        
-    additional_info_str = "\n".join(additional_info) + "\n" if additional_info else ""
-    
-    return f"""
-You are a digital marketing audit expert working for the Createlo brand. Your task is to analyze a business’s online presence and return a detailed audit report in structured JavaScript format. Use the provided business information to assess their website (if provided) and social media channels. Provide valuable insights and actionable tips to improve their digital marketing effectiveness and encourage engagement with Createlo services.
+# Static part of the audit prompt, sent as the system instruction
+CREATELO_INSTRUCTIONS = """You are a digital marketing audit expert working for the Createlo brand. Your task is to analyze a business’s online presence and return a detailed audit report in structured JSON format. Use the provided business information to assess their website (if provided) and social media channels. Provide valuable insights and actionable tips to improve their digital marketing effectiveness and encourage engagement with Createlo services.
 
 Scoring & Validation Rules:
 1. If the website URL is valid and reachable:
@@ -198,232 +432,390 @@ Scoring & Validation Rules:
    * Additionally, generate multiple relevant tips and suggestions encouraging the business to build or improve their website presence and clearly recommend Createlo services for doing so.
 3. If any social media channel is not found, state "Not found" in the summary and assign a default minimum score of 60 to that channel.
 
-Input Fields:
-{additional_info_str}
-
-Output Format: Return a clean, valid JavaScript object with this exact field order:
-const reportData = {{
-  client: "<Business name>",
-  businessoverview: "<Short description of business>",
-  instagramSummary: "<analysis or 'Not found'>",
-  facebookSummary: "<analysis or 'Not found'>",
-  instagramScore: <number>, // 60–100
-  facebookScore: <number>, // 60–100
-  websiteScore: <number>, // 60–100 (if applicable)
-  overallScore: <number>, // weighted calculation based on rules
-  businesssummary: "<10-sentence overview of their digital presence, performance on each platform, website quality, engagement opportunities, and areas for growth>",
-  insights: [
+Output Format: Return a single valid JSON object with this exact field order:
+{
+  "client": "<Business name>",
+  "businessoverview": "<Short description of business>",
+  "instagramSummary": "<analysis or 'Not found'>",
+  "facebookSummary": "<analysis or 'Not found'>",
+  "instagramScore": <number, 60-100>,
+  "facebookScore": <number, 60-100>,
+  "websiteScore": <number, 60-100, or null if there is no website>,
+  "overallScore": <number, weighted calculation based on rules>,
+  "businesssummary": "<10-sentence overview of their digital presence, performance on each platform, website quality, engagement opportunities, and areas for growth>",
+  "insights": [
     "<Insight about marketing or digital gaps>",
     "<Insight about engagement opportunity>",
     "<Insight about platform-specific performance>"
   ],
-  tips: [
+  "tips": [
     "<Unlimited actionable tips with Createlo call to action>",
     "<Each tip should map to an insight and include a suggestion>",
     "<If website is missing, give strong web-building tips and recommend Createlo services>"
   ]
-}};
+}
 
 IMPORTANT:
 1. Maintain EXACT field order as shown above
-2. Only return the JavaScript object
+2. Only return the JSON object, with no additional text, comments, or explanations
 3. Scores should be between 60-100
 4. Tips should reference Createlo services
 5. Make reasonable assumptions for missing info
 6. If website is missing, include websiteScore as null
 """
 
+# Per-request part of the prompt; everything static lives in CREATELO_INSTRUCTIONS
+_PROMPT_TEMPLATE = "Input Fields:\n{additional_info}"
+
+def build_createlo_prompt(business_name, website, instagram, facebook, email, phone, business_description):
+    fields = (
+        ("Business Name", business_name),
+        ("Business Description", business_description),
+        ("Email", email),
+        ("Phone", phone),
+        ("Website URL", website),
+        ("Instagram URL", instagram),
+        ("Facebook URL", facebook)
+    )
+    additional_info = "\n".join(f"{label}: {value}" for label, value in fields if value)
+    return _PROMPT_TEMPLATE.format(additional_info=additional_info + "\n" if additional_info else "")
+
+# Fallback for locating the report object in a non-JSON response: a reportData assignment,
+# an object starting with "client", or any flat object, found in a single scan
+_EXTRACT_PATTERN = re.compile(
+    r'(?:const|let|var)\s+reportData\s*=\s*(?P<js>{[\s\S]*?})\s*;'
+    r'|(?P<strict>{\s*["\']client["\'][\s\S]*?})'
+    r'|(?P<any>{[^{}]*})',
+    re.DOTALL
+)
+_COMMENT_BLOCK = re.compile(r'/\*.*?\*/', re.DOTALL)
+_COMMENT_LINE = re.compile(r'//.*?$', re.MULTILINE)
+_PROP_NAME = re.compile(r'([{,]\s*)(\w+)\s*:')
+_TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+def _parse_report_json(text):
+    try:
+        report_data = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return None
+    return report_data if validate_report_data(report_data) else None
+
 def extract_report_data(gemini_response):
     try:
         logger.debug("Starting report data extraction")
         
-        # First try to parse as pure JSON
-        try:
-            direct_parse = json.loads(gemini_response)
-            if validate_report_data(direct_parse):
-                return direct_parse
-        except json.JSONDecodeError:
-            pass
-        
-        # If direct parse fails, try extraction patterns
-        patterns = [
-            r'(?:const|let|var)\s+reportData\s*=\s*({[\s\S]*?})\s*;',
-            r'{\s*["\']client["\'][\s\S]*?}',
-            r'{[^{}]*}'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, gemini_response, re.DOTALL)
-            if match:
-                js_object = match.group(1) if match.lastindex else match.group(0)
-                logger.debug(f"Found object using pattern: {pattern}")
-                
-                # Clean and parse
-                report_data = clean_json_string(js_object)
-                if report_data and validate_report_data(report_data):
-                    return report_data
+        # Gemini is asked for application/json, so the response is normally the object itself
+        report_data = _parse_report_json(gemini_response)
+        if report_data:
+            return report_data
+
+        # Tolerate text around the object, e.g. a markdown code fence
+        start = gemini_response.find('{')
+        end = gemini_response.rfind('}')
+        if start != -1 and end > start:
+            report_data = _parse_report_json(gemini_response[start:end + 1])
+            if report_data:
+                return report_data
+
+        if GEMINI_STRICT_JSON:
+            logger.error("No valid JSON object found in response")
+            logger.debug("Full response:\n%s", gemini_response)
+            return None
+
+        # Last resort: recover a JavaScript object literal
+        for match in _EXTRACT_PATTERN.finditer(gemini_response):
+            js_object = match.group('js') or match.group('strict') or match.group('any')
+            logger.debug("Found object using pattern: %s", match.lastgroup)
+
+            # Clean and parse
+            report_data = clean_json_string(js_object)
+            if report_data and validate_report_data(report_data):
+                return report_data
         
         logger.error("No valid JSON object found in response")
-        logger.debug(f"Full response:\n{gemini_response}")
+        logger.debug("Full response:\n%s", gemini_response)
         return None
 
     except Exception as e:
-        logger.error(f"Extraction error: {str(e)}", exc_info=True)
+        logger.exception("Extraction error: %s", e)
         return None
 
 def clean_json_string(js_str):
+    # A JS object literal (comments, unquoted keys, trailing commas) is valid JSON5
+    try:
+        return pyjson5.decode(js_str)
+    except pyjson5.Json5DecoderException as e:
+        logger.debug("JSON5 decode failed, trying regex cleanup: %s", e)
+
     try:
         # Remove comments
-        cleaned = re.sub(r'/\*.*?\*/', '', js_str, flags=re.DOTALL)
-        cleaned = re.sub(r'//.*?$', '', cleaned, flags=re.MULTILINE)
-        
-        # Handle escaped quotes
-        cleaned = cleaned.replace(r'\"', '%%QUOTE%%')
-        cleaned = cleaned.replace('"', r'\"')
-        cleaned = cleaned.replace('%%QUOTE%%', r'\"')
+        cleaned = _COMMENT_BLOCK.sub('', js_str)
+        cleaned = _COMMENT_LINE.sub('', cleaned)
         
         # Fix property names
-        cleaned = re.sub(r'([{,]\s*)(\w+)\s*:', lambda m: f'{m.group(1)}"{m.group(2)}":', cleaned)
+        cleaned = _PROP_NAME.sub(r'\1"\2":', cleaned)
         
         # Remove trailing commas
-        cleaned = re.sub(r',\s*([}\]])', r'\1', cleaned)
+        cleaned = _TRAILING_COMMA.sub(r'\1', cleaned)
         
         # Parse JSON
-        temp_json = f'"{cleaned}"'
-        decoded_str = json.loads(temp_json)
-        return json.loads(decoded_str)
+        return orjson.loads(cleaned)
         
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON cleaning failed at position {e.pos}: {str(e)}")
-        logger.error(f"Context: {cleaned[max(0,e.pos-30):e.pos+30]}")
+    except orjson.JSONDecodeError as e:
+        logger.error("JSON cleaning failed at position %d: %s", e.pos, e)
+        logger.error("Context: %s", cleaned[max(0,e.pos-30):e.pos+30])
         return None
 
+# Body of a /submit request. Unknown fields are kept so they are stored with the submission.
+class SubmitData(BaseModel):
+    model_config = ConfigDict(extra='allow', coerce_numbers_to_str=True)
+
+    email: Annotated[str, Field(min_length=1)]
+    contactNumber: Annotated[str, Field(min_length=1)]
+    website: Optional[str] = None
+    businessName: Optional[str] = None
+    businessDescription: Optional[str] = None
+    instagram: Optional[str] = None
+    facebook: Optional[str] = None
+
+def _submit_error_response(error):
+    missing_fields = []
+    details = []
+    for err in error.errors():
+        if not err['loc']:
+            if err['type'] == 'json_invalid':
+                return jsonify({"error": "Invalid JSON"}), 400
+            return jsonify({"error": "No data received"}), 400
+        # A "missing" error carries the whole object as its input, so an empty one means {}
+        if err['type'] == 'missing' and not err['input']:
+            return jsonify({"error": "No data received"}), 400
+        if err['type'] in ('missing', 'string_too_short') or err['input'] is None:
+            missing_fields.append(err['loc'][0])
+        else:
+            details.append(f"{err['loc'][0]}: {err['msg']}")
+    if missing_fields:
+        response = {
+            "error": "Missing required fields",
+            "missing": missing_fields
+        }
+        if details:
+            response["details"] = details
+        return jsonify(response), 400
+    return jsonify({
+        "error": "Invalid request data",
+        "details": details
+    }), 400
+
+Score = Annotated[float, Field(ge=60, le=100)]
+
+# Compiled once by pydantic-core; mirrors the JSON object described in CREATELO_INSTRUCTIONS
+class ReportData(BaseModel):
+    model_config = ConfigDict(strict=True)
+
+    client: str
+    businessoverview: str
+    instagramSummary: str
+    facebookSummary: str
+    instagramScore: Score
+    facebookScore: Score
+    websiteScore: Optional[Score] = None
+    overallScore: Annotated[float, Field(ge=0, le=100)]
+    businesssummary: str
+    insights: Annotated[list[str], Field(min_length=3)]
+    tips: Annotated[list[str], Field(min_length=3)]
+
 def validate_report_data(data):
-    required_fields = {
-        'client': str,
-        'businessoverview': str,
-        'instagramSummary': str,
-        'facebookSummary': str,
-        'instagramScore': (int, float),
-        'facebookScore': (int, float),
-        'overallScore': (int, float),
-        'businesssummary': str,
-        'insights': list,
-        'tips': list
-    }
-    
-    for field, field_type in required_fields.items():
-        if field not in data:
-            logger.error(f"Missing required field: {field}")
-            return False
-        
-        if not isinstance(data[field], field_type):
-            logger.error(f"Invalid type for {field}: expected {field_type}, got {type(data[field])}")
-            return False
-    
-    # Validate scores
-    for score_field in ['instagramScore', 'facebookScore']:
-        if not (60 <= data[score_field] <= 100):
-            logger.error(f"Invalid {score_field}: must be between 60-100")
-            return False
-    
-    if not (0 <= data['overallScore'] <= 100):
-        logger.error("Invalid overallScore: must be between 0-100")
-        return False
-    
-    if 'websiteScore' in data and data['websiteScore'] is not None and not (60 <= data['websiteScore'] <= 100):
-        logger.error("Invalid websiteScore: must be between 60-100 or null")
+    try:
+        ReportData.model_validate(data)
+        return True
+    except ValidationError as e:
+        for error in e.errors():
+            field = ".".join(str(part) for part in error["loc"]) or "report"
+            logger.error("Invalid report data (%s): %s", field, error['msg'])
         return False
-    
-    # Validate lists
-    for list_field in ['insights', 'tips']:
-        if len(data[list_field]) < 3:
-            logger.error(f"{list_field} must have at least 3 items")
-            return False
-    
-    return True
+
+def _encode_gemini_payload():
+    payload = {
+        "contents": [{
+            "role": "user",
+            "parts": [{"text": "__PROMPT__"}]
+        }],
+        "safetySettings": [
+            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"}
+        ],
+        "generationConfig": {
+            "temperature": 0.7,
+            "topP": 0.9,
+            "topK": 40,
+            "response_mime_type": "application/json"
+        },
+        "systemInstruction": {"parts": [{"text": CREATELO_INSTRUCTIONS}]}
+    }
+    return orjson.dumps(payload)
+
+# The request body is encoded once with a placeholder; only the prompt is spliced in per call
+_GEMINI_PROMPT_PLACEHOLDER = b'"__PROMPT__"'
+_GEMINI_PAYLOAD = _encode_gemini_payload()
+
+def build_gemini_payload(prompt):
+    return _GEMINI_PAYLOAD.replace(_GEMINI_PROMPT_PLACEHOLDER, orjson.dumps(prompt), 1)
+
+def _report_cache_key(prompt):
+    # Whitespace differences in the submitted fields don't change the report. Case does: URL paths
+    # and social handles are case-sensitive, and the report echoes the business name as given.
+    normalized = " ".join(prompt.split())
+    return "gemini:" + hashlib.sha256(normalized.encode()).hexdigest()
+
+def get_cached_report(prompt):
+    key = _report_cache_key(prompt)
+    if redis_client is not None:
+        try:
+            cached = redis_client.get(key)
+            return orjson.loads(cached) if cached else None
+        except redis.RedisError as e:
+            logger.warning("Report cache lookup failed, falling back to local cache: %s", e)
+    with _report_cache_lock:
+        return _report_cache.get(key)
+
+def cache_report(prompt, report_data):
+    key = _report_cache_key(prompt)
+    if redis_client is not None:
+        try:
+            redis_client.setex(key, REPORT_CACHE_TTL, orjson.dumps(report_data))
+            return
+        except redis.RedisError as e:
+            logger.warning("Report cache store failed, falling back to local cache: %s", e)
+    with _report_cache_lock:
+        _report_cache[key] = report_data
+
+def _read_gemini_text(response, deadline):
+    # Parse the body incrementally as it arrives instead of buffering and decoding it whole.
+    # Only the first part of the first candidate is used, plus the fields that explain a
+    # missing text (finishReason, promptFeedback.blockReason).
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events)
+    candidate = part = -1
+    text = finish_reason = block_reason = None
+    for chunk in response.iter_content(chunk_size=8192):
+        # The read timeout only applies per socket read, so a slowly trickling body is cut off here
+        if time.monotonic() > deadline:
+            raise requests.exceptions.ReadTimeout("Gemini response not complete within the deadline")
+        parser.send(chunk)
+        for prefix, event, value in events:
+            if prefix == 'candidates.item' and event == 'start_map':
+                candidate += 1
+                part = -1
+            elif prefix == 'candidates.item.content.parts.item' and event == 'start_map':
+                part += 1
+            elif prefix == 'candidates.item.content.parts.item.text' and candidate == 0 and part == 0:
+                text = value
+            elif prefix == 'candidates.item.finishReason' and candidate == 0:
+                finish_reason = value
+            elif prefix == 'promptFeedback.blockReason':
+                block_reason = value
+        del events[:]
+    parser.close()
+
+    if text is None:
+        raise ValueError(f"No candidate text in response "
+                         f"(finishReason={finish_reason}, blockReason={block_reason})")
+    logger.debug("Gemini returned %d characters, finishReason=%s", len(text), finish_reason)
+    return text
+
+def _gemini_circuit_open():
+    return time.monotonic() < _gemini_open_until
+
+def _record_gemini_result(failed):
+    global _gemini_failures, _gemini_open_until
+    with _gemini_breaker_lock:
+        if not failed:
+            _gemini_failures = 0
+            return
+        _gemini_failures += 1
+        if _gemini_failures >= GEMINI_BREAKER_THRESHOLD:
+            _gemini_open_until = time.monotonic() + GEMINI_BREAKER_RESET_SECONDS
+            logger.warning("Gemini failed %d times in a row, pausing calls for %ds",
+                           _gemini_failures, GEMINI_BREAKER_RESET_SECONDS)
+
+def _gemini_retry_delay(response, attempt):
+    # Honour a numeric Retry-After, but never sleep longer than GEMINI_RETRY_DELAY_MAX
+    retry_after = response.headers.get('Retry-After', '')
+    delay = float(retry_after) if retry_after.isdigit() else 0.3 * 2 ** (attempt - 1)
+    return min(delay, GEMINI_RETRY_DELAY_MAX)
+
+def _post_gemini(payload, deadline):
+    for attempt in range(1, GEMINI_MAX_ATTEMPTS + 1):
+        # Later attempts only get whatever is left of the deadline after connecting
+        read_timeout = min(GEMINI_READ_TIMEOUT,
+                           max(deadline - time.monotonic() - GEMINI_CONNECT_ALLOWANCE, 1))
+        response = gemini_session.post(GEMINI_GENERATE_URL, data=payload,
+                                       timeout=(GEMINI_CONNECT_TIMEOUT, read_timeout), stream=True)
+        if response.status_code not in GEMINI_RETRY_STATUSES or attempt == GEMINI_MAX_ATTEMPTS:
+            return response
+        delay = _gemini_retry_delay(response, attempt)
+        # Too little time left for another attempt to finish; report this failure instead
+        if deadline - time.monotonic() - delay - GEMINI_CONNECT_ALLOWANCE < GEMINI_MIN_READ_TIMEOUT:
+            return response
+        logger.warning("Gemini returned %d, retrying in %.1fs", response.status_code, delay)
+        response.close()
+        time.sleep(delay)
 
 def send_to_gemini(prompt):
+    if _gemini_circuit_open():
+        logger.warning("Gemini circuit open, not sending request")
+        return "API Error: Gemini temporarily unavailable"
     try:
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro-latest:generateContent?key={GEMINI_API_KEY}"
-        headers = {'Content-Type': 'application/json'}
-        
-        payload = {
-            "contents": [{
-                "parts": [{
-                    "text": prompt + "\n\nRespond ONLY with valid JSON in this exact format:\n\n" + 
-                    "{\n" +
-                    "  \"client\": \"...\",\n" +
-                    "  \"businessoverview\": \"...\",\n" +
-                    "  \"instagramSummary\": \"...\",\n" +
-                    "  \"facebookSummary\": \"...\",\n" +
-                    "  \"instagramScore\": 0,\n" +
-                    "  \"facebookScore\": 0,\n" +
-                    "  \"websiteScore\": null,\n" +
-                    "  \"overallScore\": 0,\n" +
-                    "  \"businesssummary\": \"...\",\n" +
-                    "  \"insights\": [\"...\", \"...\", \"...\"],\n" +
-                    "  \"tips\": [\"...\", \"...\", \"...\"]\n" +
-                    "}\n\n" +
-                    "No additional text, comments, or explanations."
-                }]
-            }],
-            "safetySettings": [
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_ONLY_HIGH"}
-            ],
-            "generationConfig": {
-                "temperature": 0.7,
-                "topP": 0.9,
-                "topK": 40,
-                "response_mime_type": "application/json"
-            }
-        }
+        deadline = time.monotonic() + GEMINI_DEADLINE
 
         logger.debug("Sending to Gemini API")
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        response.raise_for_status()
-        
-        response_json = response.json()
-        logger.debug(f"API response: {json.dumps(response_json, indent=2)}")
-        
-        if not response_json.get('candidates'):
-            raise ValueError("No candidates in response")
-            
-        candidate = response_json['candidates'][0]
-        if 'content' not in candidate or 'parts' not in candidate['content']:
-            raise ValueError("Invalid response structure")
-            
-        parts = candidate['content']['parts']
-        if not parts or 'text' not in parts[0]:
-            raise ValueError("No text in response parts")
-            
-        return parts[0]['text']
-
+        response = _post_gemini(build_gemini_payload(prompt), deadline)
+        with response:
+            response.raise_for_status()
+            text = _read_gemini_text(response, deadline)
+        _record_gemini_result(failed=False)
+        return text
+
+    except requests.exceptions.HTTPError as e:
+        # Still failing after the retries counts as an outage; a bad request or auth error doesn't
+        if e.response.status_code in GEMINI_RETRY_STATUSES:
+            _record_gemini_result(failed=True)
+        logger.error("API request failed: %s", e)
+        return f"API Error: {str(e)}"
     except requests.exceptions.RequestException as e:
-        logger.error(f"API request failed: {str(e)}")
+        _record_gemini_result(failed=True)
+        logger.error("API request failed: %s", e)
         return f"API Error: {str(e)}"
     except Exception as e:
-        logger.error(f"Error processing response: {str(e)}")
+        logger.error("Error processing response: %s", e)
         return f"Processing Error: {str(e)}"
 
+# Preflight bodies and per-origin headers are built once; each OPTIONS only wraps them in a Response
+_PREFLIGHT_BODY = orjson.dumps({"message": "CORS preflight"}) + b"\n"
+_PREFLIGHT_FORBIDDEN_BODY = orjson.dumps({"error": "Origin not allowed"}) + b"\n"
+_PREFLIGHT_HEADERS = {
+    origin: (
+        ("Access-Control-Allow-Origin", origin),
+        ("Access-Control-Allow-Headers", "*"),
+        ("Access-Control-Allow-Methods", "*"),
+        ("Access-Control-Allow-Credentials", "true")
+    )
+    for origin in _ALLOWED_ORIGINS
+}
+
 def _build_cors_preflight_response():
-    origin = request.headers.get('Origin')
-    if origin not in allowed_origins:
-        return jsonify({"error": "Origin not allowed"}), 403
-    response = jsonify({"message": "CORS preflight"})
-    response.headers.add("Access-Control-Allow-Origin", origin)
-    response.headers.add("Access-Control-Allow-Headers", "*")
-    response.headers.add("Access-Control-Allow-Methods", "*")
-    response.headers.add("Access-Control-Allow-Credentials", "true")
-    return response
+    headers = _PREFLIGHT_HEADERS.get(request.headers.get('Origin'))
+    if headers is None:
+        return Response(_PREFLIGHT_FORBIDDEN_BODY, status=403, mimetype='application/json')
+    return Response(_PREFLIGHT_BODY, headers=headers, mimetype='application/json')
 
 def _corsify_actual_response(response):
     origin = request.headers.get('Origin')
-    if origin in allowed_origins:
-        response.headers.add("Access-Control-Allow-Origin", origin)
-        response.headers.add("Access-Control-Allow-Credentials", "true")
+    if origin in _ALLOWED_ORIGINS:
+        # Set rather than add, so a header already present is replaced instead of duplicated
+        response.headers["Access-Control-Allow-Origin"] = origin
+        response.headers["Access-Control-Allow-Credentials"] = "true"
     return response
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=os.environ.get('DEBUG', 'False') == 'True')
+    app.run(host='0.0.0.0', port=port, debug=DEBUG)
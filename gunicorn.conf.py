@@ -0,0 +1,16 @@
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# /submit spends most of its time waiting on Gemini, so each gevent worker multiplexes many
+# requests; gunicorn monkey-patches the stdlib before the app is imported (see app.py for grpc)
+worker_class = "gevent"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = 1000
+
+# Outlive typical load balancer idle timeouts (60s) so client connections are reused
+keepalive = 65
+
+# Import the app in each worker after fork; Firestore's gRPC channels must not be inherited
+preload_app = False